@@ -1,6 +1,9 @@
 import argparse
+import atexit
 import datetime
 import logging
+import queue
+import threading
 import time
 from .radman2 import RadMan2
 from .radhaz_standards import *
@@ -75,67 +78,175 @@ standard = None
 # Log file
 log_file = None
 
-def handle_data(data):
+# Lines waiting to be written to the log file by the log writer thread.
+log_queue = queue.Queue(maxsize=4096)
 
-    _timestamp = datetime.datetime.utcnow().isoformat() + 'Z'
+def log_writer():
+    """
+    Write queued lines to the log file in batches, flushing at most once per second.
+    A None placed on the queue causes a final flush, and stops the writer.
+    """
+    _last_flush = time.time()
 
-    # Convert percentages to E/H-field levels, if we have been provided a frequency.
-    if standard and args.frequency:
-        data['e_field'] = standard.percentage_to_efield(data['e_field_percentage'], args.frequency)
-        data['h_field'] = standard.percentage_to_hfield(data['h_field_percentage'], args.frequency)
+    while True:
+        _lines = []
+        try:
+            _lines.append(log_queue.get(timeout=1.0))
+            while len(_lines) < 64:
+                _lines.append(log_queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        _stop = None in _lines
+        if _stop:
+            _lines.remove(None)
+
+        # Keep draining the queue even if writes fail (e.g. disk full), so that
+        # handle_data and close_log_file never block on it.
+        try:
+            log_file.writelines(_lines)
+
+            if _stop or (time.time() - _last_flush) > 1.0:
+                log_file.flush()
+                _last_flush = time.time()
+        except Exception as e:
+            logging.error(f"Error writing to log file - {str(e)}")
+
+        if _stop:
+            return
+
+def close_log_file():
+    """
+    Write out anything still in the log queue, then close the log file.
+    """
+    if log_writer_thread.is_alive():
+        try:
+            log_queue.put(None, timeout=2.0)
+        except queue.Full:
+            logging.error("Log queue full - could not stop log writer!")
+
+        log_writer_thread.join(timeout=5.0)
+
+    # Don't close the file out from under a writer that is still running.
+    if log_writer_thread.is_alive():
+        logging.error("Log writer did not stop - log file not closed cleanly.")
+        return
+
+    try:
+        log_file.close()
+    except Exception as e:
+        logging.error(f"Error closing log file - {str(e)}")
 
-        logging.info(f"{_timestamp}: E-Field: {data['e_field']:.3f} V/m ({data['e_field_percentage']:.2f}%), H-Field: {data['h_field']:.3f} A/m ({data['h_field_percentage']:.2f}%)")
+# Log file line formats, with and without converted E/H-field levels.
+LOG_FMT_WITH_FIELDS = "%s,%.2f,%.2f,%s,%.3f,%.3f\n"
+LOG_FMT = "%s,%.2f,%.2f,%s\n"
 
-    else:
-        logging.info(f"{_timestamp}: E-Field: {data['e_field_percentage']:.2f}%, H-Field: {data['h_field_percentage']:.2f}%")
+# Last whole second seen by iso_timestamp(), and its formatted string.
+_timestamp_cache = [None, '']
+
+def iso_timestamp():
+    """
+    Return the current UTC time as an ISO-8601 string, e.g. 2023-04-30T04:28:07.212924Z
+    The formatted whole-second portion is re-used until the second changes.
+    """
+    _sec, _ns = divmod(time.time_ns(), 1000000000)
 
-    if log_file:
+    if _sec != _timestamp_cache[0]:
+        _timestamp_cache[0] = _sec
+        _timestamp_cache[1] = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(_sec))
 
-        if standard and args.frequency:
-            _log_line = f"{_timestamp},{data['e_field_percentage']:.2f},{data['h_field_percentage']:.2f},{data['battery_percentage']},{data['e_field']:.3f},{data['h_field']:.3f}\n"
-        else:
-            _log_line = f"{_timestamp},{data['e_field_percentage']:.2f},{data['h_field_percentage']:.2f},{data['battery_percentage']}\n"
+    return "%s.%06dZ" % (_timestamp_cache[1], _ns // 1000)
 
-        logging.debug(f"Logged Line: {_log_line.strip()}")
-        log_file.write(_log_line)
-        log_file.flush()
 
+def queue_log_line(log_line):
+    """
+    Pass a line to the log writer thread.
+    """
+    logging.debug("Logged Line: %s", log_line.strip())
+    try:
+        log_queue.put_nowait(log_line)
+    except queue.Full:
+        logging.error("Log queue full - dropping log line!")
 
 
-_radman = RadMan2(args.port, auto=False, callback=handle_data)
+_radman = RadMan2(args.port, auto=False)
 
 print_device_info(_radman.device_info)
 print_probe_info(_radman.probe_info)
 
 standard = choose_standard(_radman.probe_info['standard_name'])
 if standard and args.frequency:
+    # The frequency is fixed for the whole run, so only look the limits up once.
+    e_lim = standard.efield_limit(args.frequency)
+    h_lim = standard.hfield_limit(args.frequency)
     logging.info(f"Using RADHAZ Standard '{standard.name}', for {args.frequency} MHz.")
-    logging.info(f"Limits: {standard.efield_limit(args.frequency):.3f} V/m, {standard.hfield_limit(args.frequency):.3f} A/m")
+    logging.info(f"Limits: {e_lim:.3f} V/m, {h_lim:.3f} A/m")
 
 
 if args.log:
     _logfilename = datetime.datetime.utcnow().strftime("%Y%m%d-%H%M%S.log")
 
-    log_file = open(_logfilename,'w')
+    # Large buffer - the log writer thread flushes it periodically.
+    log_file = open(_logfilename, 'w', buffering=1<<20, newline='')
 
     log_file.write(f"# Device Info: {_radman.device_info}\n")
     log_file.write(f"# Probe Info: {_radman.probe_info}\n")
     if standard and args.frequency:
         log_file.write(f"# Using RADHAZ Standard '{standard.name}', for {args.frequency} MHz.\n")
-        log_file.write(f"# Limits: {standard.efield_limit(args.frequency):.3f} V/m, {standard.hfield_limit(args.frequency):.3f} A/m\n")
+        log_file.write(f"# Limits: {e_lim:.3f} V/m, {h_lim:.3f} A/m\n")
         log_file.write("timestamp,e_field_percent,h_field_percent,battery,e_field,h_field\n")
     else:
         log_file.write("timestamp,e_field_percent,h_field_percent,battery\n")
 
     logging.info(f"Opened Log File: {_logfilename}")
 
+    log_writer_thread = threading.Thread(target=log_writer, daemon=True)
+    log_writer_thread.start()
+    atexit.register(close_log_file)
+
+
+# Build the measurement callback, with the conversions, log writer and output mode all
+# bound up-front, rather than re-checked for every sample.
+_queue_log_line = queue_log_line if log_file else None
+
+if standard and args.frequency:
+
+    def handle_data(data, _convert=standard.percentage_to_fields, _freq=args.frequency, _log=_queue_log_line):
+
+        _timestamp = iso_timestamp()
+        _e_pct = data['e_field_percentage']
+        _h_pct = data['h_field_percentage']
+
+        # Convert percentages to E/H-field levels, using the standard's own conversions.
+        _e, _h = _convert(_e_pct, _h_pct, _freq)
+        data['e_field'] = _e
+        data['h_field'] = _h
+
+        logging.info("%s: E-Field: %.3f V/m (%.2f%%), H-Field: %.3f A/m (%.2f%%)", _timestamp, _e, _e_pct, _h, _h_pct)
+
+        if _log:
+            _log(LOG_FMT_WITH_FIELDS % (_timestamp, _e_pct, _h_pct, data['battery_percentage'], _e, _h))
+
+else:
+
+    def handle_data(data, _log=_queue_log_line):
+
+        _timestamp = iso_timestamp()
+        _e_pct = data['e_field_percentage']
+        _h_pct = data['h_field_percentage']
+
+        logging.info("%s: E-Field: %.2f%%, H-Field: %.2f%%", _timestamp, _e_pct, _h_pct)
+
+        if _log:
+            _log(LOG_FMT % (_timestamp, _e_pct, _h_pct, data['battery_percentage']))
+
+_radman.callback = handle_data
 
 _radman.start_measurement()
 
 
-# Just wait for data
+# Just wait for data, until we are interrupted or the RadMan2 is closed.
 try:
-    while True:
-        time.sleep(1)
-except Exception as e:
+    _radman.closed.wait()
+except KeyboardInterrupt:
     _radman.close()
\ No newline at end of file
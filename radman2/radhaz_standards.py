@@ -3,7 +3,9 @@
 #   RADHAZ Exposure Limit Conversions
 #
 
+import array
 import logging
+import math
 import numpy as np
 
 class FCC96326(object):
@@ -16,8 +18,17 @@ class FCC96326(object):
     Reference: https://transition.fcc.gov/Bureaus/Engineering_Technology/Orders/1996/fcc96326.pdf
     """
 
+    # Maximum number of frequencies to keep in each limit cache.
+    LIMIT_CACHE_SIZE = 128
+
     def __init__(self, occupational=True):
 
+        # Limits for recently looked-up frequencies, as plain Python floats, so the
+        # per-sample conversions don't need to go through numpy. Bounded to
+        # LIMIT_CACHE_SIZE entries, dropping the oldest, so frequency sweeps don't
+        # grow them without limit.
+        self._efield_limit_cache = {}
+        self._hfield_limit_cache = {}
 
         if occupational:
             self.name = "FCC 96-326 Controlled Environments (Occupational)"
@@ -26,132 +37,157 @@ class FCC96326(object):
             self.name = "FCC 96-326 Uncontrolled Environments (General Public)"
             self.init_tables_general_public()
 
+        # Limit lookups index the tables directly, so they rely on the frequency table
+        # being a regular grid of freq_khz_min + n*freq_step_khz.
+        _grid_khz = self.freq_khz_min + self.freq_step_khz * np.arange(len(self.frequency_mhz))
+        assert np.array_equal(self.frequency_mhz, _grid_khz / 1000.0), "Frequency table is not a regular grid!"
+        assert len(self.efield) == len(self.hfield) == len(self.frequency_mhz), "Limit tables do not match the frequency table!"
+
+        # Typed copies of the tables for scalar lookups, which index straight to a
+        # Python float. The numpy arrays are kept for vectorised use.
+        self._frequency_mhz_array = array.array('d', self.frequency_mhz.astype(np.float64).tobytes())
+        self._efield_array = array.array('d', self.efield.astype(np.float64).tobytes())
+        self._hfield_array = array.array('d', self.hfield.astype(np.float64).tobytes())
+
     
     def init_tables_occupational(self):
         """
         Generate the E and H-field limits for the FCC 96-326 'Controlled Environment'
-        in 1 kHz resolution.
+        in 10 kHz resolution.
         (We refer to this as 'occupational')
         """
 
-        self.frequency_mhz = np.array([])
-        self.efield = np.array([])
-        self.hfield = np.array([])
-
-        # 0.003 - 0.1 MHz. E = 614 V/m, H = 163 A/m
-        _freq = np.arange(0.003, 0.1, 0.01)
-        _efield = np.ones(len(_freq)) * 614
-        _hfield = np.ones(len(_freq)) * 163
-
-        self.frequency_mhz = np.append(self.frequency_mhz, _freq)
-        self.efield = np.append(self.efield, _efield)
-        self.hfield = np.append(self.hfield, _hfield)
-
-        # 0.1 - 3.0 MHz. E = 614 V/m, H = 16.3/f A/m
-        _freq = np.arange(0.1, 3.0, 0.01)
-        _efield = np.ones(len(_freq)) * 614
-        _hfield = 16.3 / _freq
-
-        self.frequency_mhz = np.append(self.frequency_mhz, _freq)
-        self.efield = np.append(self.efield, _efield)
-        self.hfield = np.append(self.hfield, _hfield)
-
-        # 3.0-30 MHz. E = 1842/f V/m, H = 16.3/f A/m
-        _freq = np.arange(3.0, 30.0, 0.01)
-        _efield = 1842.0 / _freq
-        _hfield = 16.3 / _freq
-
-        self.frequency_mhz = np.append(self.frequency_mhz, _freq)
-        self.efield = np.append(self.efield, _efield)
-        self.hfield = np.append(self.hfield, _hfield)
-
-        # 30-100 MHz. E = 61.4 V/m, H = 16.3/f A/m
-        _freq = np.arange(30.0, 100.0, 0.01)
-        _efield = np.ones(len(_freq)) * 61.4
-        _hfield = 16.3 / _freq
-
-        self.frequency_mhz = np.append(self.frequency_mhz, _freq)
-        self.efield = np.append(self.efield, _efield)
-        self.hfield = np.append(self.hfield, _hfield)
-
-        # 100-300 MHz E = 61.4 V/m, H = 0.163 A/m
-        _freq = np.arange(100.0, 300.0, 0.01)
-        _efield = np.ones(len(_freq)) * 61.4
-        _hfield = np.ones(len(_freq)) * 0.163
-
-        self.frequency_mhz = np.append(self.frequency_mhz, _freq)
-        self.efield = np.append(self.efield, _efield)
-        self.hfield = np.append(self.hfield, _hfield)
-
-        # 300-3000 MHz. S = f/300 W/m^2, E = sqrt(S*377), H = sqrt(S/377) (plane-wave approximation)
-        _freq = np.arange(300.0, 3000.0, 0.01)
-        _s = _freq / 300 # W / m^2
-        _efield = np.sqrt(_s*377.0)
-        _hfield = np.sqrt(_s/377.0)
-
-        self.frequency_mhz = np.append(self.frequency_mhz, _freq)
-        self.efield = np.append(self.efield, _efield)
-        self.hfield = np.append(self.hfield, _hfield)
-
-        # # 3000-300000 MHz. S = 10 W/m^2, E = sqrt(S*377), H = sqrt(S/377)
-        # _freq = np.arange(3000.0, 300000.0, 0.01)
-        # _s = np.ones(len(_freq)) * 10 # W / m^2
-        # _efield = np.sqrt(_s*377.0)
-        # _hfield = np.sqrt(_s/377.0)
-
-        # self.frequency_mhz = np.append(self.frequency_mhz, _freq)
-        # self.efield = np.append(self.efield, _efield)
-        # self.hfield = np.append(self.hfield, _hfield)
-        
+        # The table is built on an integer kHz grid, so that entries land exactly on
+        # segment boundaries, and a frequency maps directly to a table index.
+        self.freq_khz_min = 0
+        self.freq_step_khz = 10
+        _freq_khz = np.arange(self.freq_khz_min, 3000000, self.freq_step_khz)
+        self.frequency_mhz = _freq_khz / 1000.0
+
+        # For 300 MHz and above, S = f/300 W/m^2 (or 10 W/m^2 above 3000 MHz),
+        # E = sqrt(S*377), H = sqrt(S/377) (plane-wave approximation)
+        self.efield, self.hfield = _build_piecewise(self.frequency_mhz, [
+            # (Lower MHz, Upper MHz, E V/m, H A/m)
+            (0.0, 0.1, 614.0, 163.0),
+            (0.1, 3.0, 614.0, lambda f: 16.3 / f),
+            (3.0, 30.0, lambda f: 1842.0 / f, lambda f: 16.3 / f),
+            (30.0, 100.0, 61.4, lambda f: 16.3 / f),
+            (100.0, 300.0, 61.4, 0.163),
+            (300.0, 3000.0, lambda f: np.sqrt((f/300)*377.0), lambda f: np.sqrt((f/300)/377.0)),
+            # (3000.0, 300000.0, math.sqrt(10*377.0), math.sqrt(10/377.0)),
+        ])
+
     
     def init_tables_general_public(self):
         """
         Generate the E and H-field limits for the FCC 96-326 'Uncontrolled Environment'
-        in 1 kHz resolution.
+        in 10 kHz resolution.
         (We refer to this as 'general public')
 
-        TODO
+        Limits are from Table 1(B) of FCC 96-326, which starts at 0.3 MHz.
         """
 
-        self.frequency_mhz = np.array([])
-        self.efield = np.array([])
-        self.hfield = np.array([])
+        self.freq_khz_min = 300
+        self.freq_step_khz = 10
+        _freq_khz = np.arange(self.freq_khz_min, 3000000, self.freq_step_khz)
+        self.frequency_mhz = _freq_khz / 1000.0
+
+        # For 300 MHz and above, S = f/150 W/m^2 (or 10 W/m^2 above 1500 MHz),
+        # E = sqrt(S*377), H = sqrt(S/377) (plane-wave approximation)
+        self.efield, self.hfield = _build_piecewise(self.frequency_mhz, [
+            # (Lower MHz, Upper MHz, E V/m, H A/m)
+            (0.3, 1.34, 614.0, 1.63),
+            (1.34, 30.0, lambda f: 824.0 / f, lambda f: 2.19 / f),
+            (30.0, 300.0, 27.5, 0.073),
+            (300.0, 1500.0, lambda f: np.sqrt((f/150)*377.0), lambda f: np.sqrt((f/150)/377.0)),
+            (1500.0, 3000.0, math.sqrt(10*377.0), math.sqrt(10/377.0)),
+        ])
+
+
+    def _table_index(self, frequency_mhz):
+        """
+        Find the index of the table entry closest to the supplied frequency.
+
+        The table is on a regular kHz grid, so this is a direct calculation rather
+        than a search. Frequencies outside the table use the nearest end.
+        """
+        idx = int(round((frequency_mhz*1000.0 - self.freq_khz_min) / self.freq_step_khz))
+        idx = min(max(idx, 0), len(self._frequency_mhz_array) - 1)
+
+        if abs(self._frequency_mhz_array[idx] - frequency_mhz) > 1.0:
+            logging.warning(f"WARNING - Frequency {frequency_mhz:.3f} MHz is far from nearest match in table ({self._frequency_mhz_array[idx]} MHz.)")
+
+        return idx
 
 
     def efield_limit(self, frequency_mhz):
-        idx = (np.abs(self.frequency_mhz - frequency_mhz)).argmin()
+        """
+        Return the E-field limit at a frequency. Results are cached, so the
+        'far from nearest match' warning is only logged on the first lookup.
+        """
+        _limit = self._efield_limit_cache.get(frequency_mhz)
 
-        if np.abs(self.frequency_mhz[idx] - frequency_mhz) > 1.0:
-            logging.warning(f"WARNING - Frequency {frequency_mhz:.3f} MHz is far from nearest match in table ({self.frequency_mhz[idx]} MHz.)")
+        if _limit is None:
+            _limit = self._efield_array[self._table_index(frequency_mhz)]
+            if len(self._efield_limit_cache) >= self.LIMIT_CACHE_SIZE:
+                del self._efield_limit_cache[next(iter(self._efield_limit_cache))]
+            self._efield_limit_cache[frequency_mhz] = _limit
 
-        return self.efield[idx]
+        return _limit
 
 
     def hfield_limit(self, frequency_mhz):
-        idx = (np.abs(self.frequency_mhz - frequency_mhz)).argmin()
-        if np.abs(self.frequency_mhz[idx] - frequency_mhz) > 1.0:
-            logging.warning(f"WARNING - Frequency {frequency_mhz:.3f} MHz is far from nearest match in table ({self.frequency_mhz[idx]} MHz.)")
+        """
+        Return the H-field limit at a frequency. Results are cached, so the
+        'far from nearest match' warning is only logged on the first lookup.
+        """
+        _limit = self._hfield_limit_cache.get(frequency_mhz)
+
+        if _limit is None:
+            _limit = self._hfield_array[self._table_index(frequency_mhz)]
+            if len(self._hfield_limit_cache) >= self.LIMIT_CACHE_SIZE:
+                del self._hfield_limit_cache[next(iter(self._hfield_limit_cache))]
+            self._hfield_limit_cache[frequency_mhz] = _limit
 
-        return self.hfield[idx]
+        return _limit
     
 
     def percentage_to_efield(self, percentage, frequency_mhz):
 
-        if percentage == 0.0:
+        if not percentage:
             return 0.0
 
-        _percentage_db = 10*np.log10(percentage/100.0)
-
-        return 10 **( _percentage_db / 20.0 ) * self.efield_limit(frequency_mhz)
+        # Percentages are of the power-density limit, so the field level scales
+        # with the square root. (Equivalent to 10**(10*log10(p/100)/20))
+        return math.sqrt(percentage * 0.01) * self.efield_limit(frequency_mhz)
 
 
     def percentage_to_hfield(self, percentage, frequency_mhz):
-        if percentage == 0.0:
+        if not percentage:
             return 0.0
 
-        _percentage_db = 10*np.log10(percentage/100.0)
+        return math.sqrt(percentage * 0.01) * self.hfield_limit(frequency_mhz)
+
+
+    def percentage_to_fields(self, e_percentage, h_percentage, frequency_mhz):
+        """
+        Convert E and H-field limit percentages to E and H-field levels in one call.
+        Returns a tuple of (efield, hfield).
+        """
+        return self.percentage_to_efield(e_percentage, frequency_mhz), self.percentage_to_hfield(h_percentage, frequency_mhz)
+
+
+    def percentage_to_fields_batch(self, e_percentages, h_percentages, frequency_mhz):
+        """
+        Vectorised version of percentage_to_fields, for converting many E and H-field
+        percentages (e.g. the e_field_percent and h_field_percent columns of a log file)
+        at a single frequency.
+        Returns a tuple of numpy arrays (efield, hfield).
+        """
+        _e_ratio = np.sqrt(np.asarray(e_percentages, dtype=float) * 0.01)
+        _h_ratio = np.sqrt(np.asarray(h_percentages, dtype=float) * 0.01)
 
-        return 10**( _percentage_db / 20.0 ) * self.hfield_limit(frequency_mhz)
+        return _e_ratio * self.efield_limit(frequency_mhz), _h_ratio * self.hfield_limit(frequency_mhz)
 
 
     def efield_to_percentage(self, value, frequency_mhz):
@@ -162,6 +198,24 @@ class FCC96326(object):
 
 
 
+def _build_piecewise(frequency_mhz, segments):
+    """
+    Build E and H-field limit tables over a frequency grid (MHz).
+
+    segments is a list of (lower_mhz, upper_mhz, efield, hfield) tuples, covering
+    lower_mhz <= f < upper_mhz. The field values may be constants, or functions of
+    frequency (MHz), which are only evaluated over their own segment.
+    Each field is built with one np.piecewise call, using a boolean mask per
+    segment. Constant segments are not materialised as arrays.
+    """
+    _conditions = [(frequency_mhz >= _lower) & (frequency_mhz < _upper) for (_lower, _upper, _e, _h) in segments]
+
+    _efield = np.piecewise(frequency_mhz, _conditions, [_e for (_lower, _upper, _e, _h) in segments])
+    _hfield = np.piecewise(frequency_mhz, _conditions, [_h for (_lower, _upper, _e, _h) in segments])
+
+    return _efield, _hfield
+
+
 def choose_standard(standard_name):
 
     if "FCC 96-326 / Occupational" in standard_name:
@@ -177,7 +231,8 @@ if __name__ == "__main__":
     freq = 100.0
 
     for percent in range(0,200):
-        print(f"100 MHz, {percent}% - E: {standard.percentage_to_efield(percent, freq):0.3f} V/m, H: {standard.percentage_to_hfield(percent, freq):0.3f} A/m,")
+        _efield, _hfield = standard.percentage_to_fields(percent, percent, freq)
+        print(f"100 MHz, {percent}% - E: {_efield:0.3f} V/m, H: {_hfield:0.3f} A/m,")
 
 
     # for freq in range(0,1000):
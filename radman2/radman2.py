@@ -2,8 +2,7 @@ import datetime
 import logging
 import sys
 import serial
-import time
-from threading import Thread, Lock
+from threading import Thread, Lock, Event
 
 DEFAULT_RADMAN_PORT = "/dev/ttyACM0"
 
@@ -19,6 +18,9 @@ class RadMan2(object):
         """
 
         self.measurement_running = False
+        self.measurement_thread = None
+        # Set once close() has been called.
+        self.closed = Event()
         self.callback = callback
         self.sample_rate = sample_rate
 
@@ -86,24 +88,29 @@ class RadMan2(object):
         if len(_fields) != 12:
             raise ValueError(f"Incorrect number of fields {len(_fields)} from RadMan Probe Info response!")
 
+        # Probes without a H-field sensor may not report a usable H-field range.
+        try:
+            _h_field_lower = float(_fields[8])
+            _h_field_upper = float(_fields[9])
+        except ValueError as e:
+            logging.warning(f"Could not parse probe H-field frequency range - {str(e)}")
+            _h_field_lower = None
+            _h_field_upper = None
+
         output = {
             'product_name': _fields[0],
             'production_id': _fields[1],
             'serial_number': _fields[2],
             'calibration_date': _fields[3],
             'calibration_due': _fields[4],
-            'field_type': _fields[5]
+            'field_type': _fields[5],
+            'e_field_lower_frequency_hz': float(_fields[6]),
+            'e_field_upper_frequency_hz': float(_fields[7]),
+            'h_field_lower_frequency_hz': _h_field_lower,
+            'h_field_upper_frequency_hz': _h_field_upper,
+            'shaped': _fields[10],
+            'standard_name': _fields[11]
         }
-        try:
-            output
-            output['e_field_lower_frequency_hz'] = float(_fields[6])
-            output['e_field_upper_frequency_hz'] = float(_fields[7])
-            output['h_field_lower_frequency_hz'] = float(_fields[8])
-            output['h_field_upper_frequency_hz'] = float(_fields[9])
-            output['shaped'] = _fields[10]
-            output['standard_name'] = _fields[11]
-        except Exception as e:
-            logging.warning(f"Exception when parsing probe info fields - {str(e)}")
 
         return output
 
@@ -138,31 +145,58 @@ class RadMan2(object):
 
         """
 
+        # Read whatever is waiting on the port in one go, and split it into lines
+        # ourselves, rather than reading a line at a time.
+        _buffer = bytearray()
+
         while self.measurement_running:
 
-            _line = self.s.readline().decode().strip()
-            
-            try:
-                # Split into comma separated fields, remove last ; character
-                _fields = _line[:-1].split(',')
-
-                if len(_fields) != 6:
-                    logging.error(f"Not enough fields in measurement line.")
-                    continue
-                else:
-                    _output = {}
-                    _output['e_field_percentage'] = float(_fields[0])/100.0
-                    _output['h_field_percentage'] = float(_fields[1])/100.0
-                    _output['unknown'] = _fields[2]
-                    _output['e_field_ok'] = _fields[3]
-                    _output['h_fields_ok'] = _fields[4]
-                    _output['battery_percentage'] = float(_fields[5])
-
-                    if self.callback:
-                        self.callback(_output)
-
-            except Exception as e:
-                logging.error(f"Could not parse measurement line: {str(_line)} - {str(e)}")
+            _chunk = self.s.read(max(1, self.s.in_waiting))
+
+            if not _chunk:
+                continue
+
+            _buffer += _chunk
+
+            while b'\n' in _buffer:
+                _line, _, _buffer = _buffer.partition(b'\n')
+                self._parse_and_dispatch(_line)
+
+
+    def _parse_and_dispatch(self, line):
+        """
+        Parse a single measurement line, and pass the result to the callback.
+        """
+
+        try:
+            # Work directly on the raw bytes - float() accepts ASCII bytes, so only the
+            # short status fields need decoding.
+            _line = line.rstrip(b'\r\n')
+
+            if not _line.endswith(b';'):
+                logging.error(f"Could not parse measurement line: {line.decode(errors='replace').strip()}")
+                return
+
+            # Split into comma separated fields, remove last ; character
+            _fields = _line[:-1].split(b',')
+
+            if len(_fields) != 6:
+                logging.error(f"Not enough fields in measurement line.")
+                return
+
+            _output = {}
+            _output['e_field_percentage'] = float(_fields[0])/100.0
+            _output['h_field_percentage'] = float(_fields[1])/100.0
+            _output['unknown'] = _fields[2].decode()
+            _output['e_field_ok'] = _fields[3].decode()
+            _output['h_fields_ok'] = _fields[4].decode()
+            _output['battery_percentage'] = float(_fields[5])
+
+            if self.callback:
+                self.callback(_output)
+
+        except Exception as e:
+            logging.error(f"Could not parse measurement line: {line.decode(errors='replace').strip()} - {str(e)}")
         
 
     def start_measurement(self):
@@ -214,8 +248,22 @@ class RadMan2(object):
 
     def close(self):
         self.measurement_running = False
-        time.sleep(5)
-        self.s.close()
+
+        if self.measurement_thread:
+            # Abort any read in progress so the measurement loop exits straight away,
+            # then wait for it, rather than a fixed delay.
+            try:
+                self.s.cancel_read()
+            except Exception:
+                pass
+            self.measurement_thread.join(timeout=2.0)
+
+        try:
+            self.s.close()
+        except Exception:
+            pass
+
+        self.closed.set()
 
 
 if __name__ == "__main__":
@@ -245,10 +293,8 @@ if __name__ == "__main__":
     print(_radman.probe_info)
 
     try:
-        while True:
-            time.sleep(1)
-    
-    except:
+        _radman.closed.wait()
+    except KeyboardInterrupt:
         _radman.close()
 
     
\ No newline at end of file